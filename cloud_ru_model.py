@@ -4,9 +4,165 @@
 """
 
 import os
-from typing import List, Dict, Any, Optional
-from smolagents.models import Model
-from openai import OpenAI
+import json
+import asyncio
+import hashlib
+from types import MappingProxyType
+from typing import List, Dict, Any, AsyncIterator, Iterator, Mapping, Optional, Tuple
+import httpx
+from smolagents import ChatMessage
+from smolagents.models import ChatMessageStreamDelta, Model
+from openai import (
+    OpenAI,
+    AsyncOpenAI,
+    DefaultHttpxClient,
+    DefaultAsyncHttpxClient,
+    DefaultAioHttpClient
+)
+from semantic_cache import SemanticCache
+
+
+# Соответствие ролей smolagents ролям Cloud.ru API (None - сообщение пропускается)
+# tool_response конвертируется в assistant, чтобы сохранить контекст
+_ROLE_MAP = {
+    "tool_call": None,
+    "tool-call": None,
+    "tool_response": "assistant",
+    "tool-response": "assistant",
+    "system": "system",
+    "user": "user",
+    "assistant": "assistant"
+}
+
+
+def _parse_stop_sequences(stop_sequences) -> Tuple[bool, List[str]]:
+    """
+    Разбирает stop sequences один раз за запрос
+    
+    Returns:
+        Кортеж (это запрос CodeAgent, список валидных stop sequences)
+    """
+    if not stop_sequences:
+        return False, []
+    
+    # Cloud.ru может не поддерживать все stop sequences
+    valid_stops = [s for s in stop_sequences if isinstance(s, str) and len(s) > 0]
+    is_code_agent = any("<code>" in s for s in valid_stops)
+    return is_code_agent, valid_stops[:4]  # Максимум 4 stop sequences
+
+
+# Системные промпты длиннее этого заменяются упрощенным промптом для GLM-4.5
+MAX_SYSTEM_PROMPT_LENGTH = 10000
+
+# Упрощенное системное сообщение для GLM-4.5
+# GLM-4.5 поддерживает reasoning mode и tool calling
+_SIMPLIFIED_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "You are an expert assistant who solves tasks step by step using code.\n"
+        "GLM-4.5 reasoning mode enabled.\n"
+        "Always respond in this format:\n"
+        "Thought: [your reasoning]\n"
+        "<code>\n[your python code]\n</code>\n"
+        "Use print() to output intermediate results.\n"
+        "Use final_answer() to provide the final result."
+    )
+}
+
+# Шаблоны сообщений об ошибке запроса к Cloud.ru API
+_ERROR_LOG_TEMPLATE = "Ошибка при запросе к Cloud.ru API: {}"
+_CACHE_ERROR_LOG_TEMPLATE = "Семантический кэш недоступен, запрос выполняется без него: {}"
+_ERROR_TEMPLATE = "Извините, произошла ошибка: {}"
+# Текст ошибки подставляется через repr, чтобы кавычки в нем не ломали код
+_CODE_AGENT_ERROR_TEMPLATE = "Thought: An error occurred.\n<code>\nprint({!r})\n</code>"
+
+# Конец блока кода в ответе CodeAgent: после него генерацию можно остановить
+_CODE_END = "</code>"
+
+
+def _cut_after_code_end(tail: str, delta: str) -> Tuple[str, bool]:
+    """
+    Обрезает фрагмент стрима сразу после закрывающего </code>
+    
+    Args:
+        tail: Последние символы уже полученного текста (короче _CODE_END),
+            чтобы найти </code>, разорванный между фрагментами
+        delta: Новый фрагмент текста
+        
+    Returns:
+        Кортеж (фрагмент для выдачи, найден ли конец блока кода)
+    """
+    text = tail + delta
+    end = text.find(_CODE_END)
+    if end == -1:
+        return delta, False
+    return text[len(tail):end + len(_CODE_END)], True
+
+
+# Роли, которые Cloud.ru API принимает без конвертации
+_OPENAI_ROLES = frozenset(("system", "user", "assistant"))
+
+
+def _is_openai_format(messages) -> bool:
+    """
+    Проверяет, что сообщения уже имеют вид {"role": ..., "content": str}
+    с ролями, которые не нужно конвертировать
+    """
+    return all(
+        type(msg) is dict
+        and len(msg) == 2
+        and msg.get("role") in _OPENAI_ROLES
+        and type(msg.get("content")) is str
+        for msg in messages
+    )
+
+
+def _extract_content(msg) -> str:
+    """
+    Извлекает текст сообщения из ChatMessage или dict
+    """
+    try:
+        content = msg.content
+    except AttributeError:
+        content = msg.get("content", "")
+    
+    if isinstance(content, str):
+        return content
+    
+    # Если контент - это список с dict внутри
+    if isinstance(content, list) and content and isinstance(content[0], dict) and 'text' in content[0]:
+        content = content[0]['text']
+        if isinstance(content, str):
+            return content
+    
+    return str(content)
+
+
+def _convert_messages(messages) -> List[Dict[str, str]]:
+    """
+    Конвертирует сообщения smolagents (ChatMessage или dict) в формат Cloud.ru API
+    
+    Роль каждого сообщения переводится через _ROLE_MAP, все сообщения
+    собираются одним и тем же dict {"role", "content"}
+    """
+    if _is_openai_format(messages):
+        # Сообщения уже в нужном формате: копируем только список,
+        # сами dict дальше не изменяются
+        return list(messages)
+    
+    converted_messages = []
+    for msg in messages:
+        # Извлекаем роль: у ChatMessage это MessageRole, у dict - строка
+        role = getattr(msg, "role", None)
+        if role is None:
+            role = msg.get("role", "user")
+        
+        # Пропускаем tool_call сообщения и неизвестные роли
+        role = _ROLE_MAP.get(getattr(role, "value", role))
+        if role is not None:
+            converted_messages.append({"role": role, "content": _extract_content(msg)})
+    
+    return converted_messages
 
 
 class CloudRuModel(Model):
@@ -23,7 +179,13 @@ class CloudRuModel(Model):
         temperature: float = 0.5,
         max_tokens: int = 5000,
         top_p: float = 0.95,
-        presence_penalty: float = 0
+        presence_penalty: float = 0,
+        http2: bool = True,
+        async_transport: str = "aiohttp",
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 75.0,
+        system_prompt_override: Optional[str] = None
     ):
         """
         Инициализация модели Cloud.ru
@@ -36,12 +198,43 @@ class CloudRuModel(Model):
             max_tokens: Максимальное количество токенов в ответе
             top_p: Параметр nucleus sampling
             presence_penalty: Штраф за повторение
+            http2: Использовать HTTP/2 (параллельные запросы идут через одно соединение).
+                Действует на синхронный клиент и на асинхронный при async_transport="httpx";
+                транспорт aiohttp поддерживает только HTTP/1.1
+            async_transport: HTTP-транспорт для agenerate: "aiohttp" (по умолчанию,
+                лучше масштабируется на много параллельных HTTP/1.1 запросов) или
+                "httpx" (поддерживает HTTP/2 при http2=True)
+            max_connections: Максимальное количество соединений в пуле
+            max_keepalive_connections: Количество соединений, удерживаемых открытыми
+            keepalive_expiry: Время жизни простаивающего соединения в секундах
+            system_prompt_override: Системный промпт, который заменяет промпт агента
+                во всех запросах (без проверки длины на каждом вызове)
         """
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.top_p = top_p
         self.presence_penalty = presence_penalty
+        self.http2 = http2
+        
+        if async_transport not in ("aiohttp", "httpx"):
+            raise ValueError(
+                f"Неизвестный async_transport: {async_transport!r}, "
+                "допустимые значения: 'aiohttp', 'httpx'"
+            )
+        self.async_transport = async_transport
+        
+        # Системное сообщение собирается один раз, а не на каждом вызове
+        self._system_message: Optional[Dict[str, str]] = None
+        if system_prompt_override is not None:
+            self._system_message = {"role": "system", "content": system_prompt_override}
+        
+        # Лимиты пула соединений, общие для синхронного и асинхронного клиентов
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
         
         # Получаем API ключ из аргументов или переменных окружения
         self.api_key = api_key or os.getenv("CLOUD_RU_API_KEY")
@@ -58,11 +251,92 @@ class CloudRuModel(Model):
             api_key=self.api_key,
             base_url=self.base_url,
             timeout=60.0,  # Увеличиваем таймаут до 60 секунд
-            max_retries=2  # Добавляем повторные попытки
+            max_retries=2,  # Добавляем повторные попытки
+            http_client=DefaultHttpxClient(
+                http2=self.http2,
+                limits=self._limits,
+                timeout=60.0
+            )
         )
         
+        # Асинхронный клиент создается лениво при первом вызове agenerate
+        # и привязан к event loop, в котором был создан
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Семантический кэш ответов включается через CLOUD_RU_SEMANTIC_CACHE=1
+        self.semantic_cache: Optional[SemanticCache] = None
+        if os.getenv("CLOUD_RU_SEMANTIC_CACHE") == "1":
+            self.semantic_cache = SemanticCache(
+                db_path=os.getenv("CLOUD_RU_SEMANTIC_CACHE_PATH", "semantic_cache.db")
+            )
+        
+        # Информация о модели собирается один раз и доступна только для чтения
+        self._info = MappingProxyType({
+            "provider": "Cloud.ru",
+            "model_name": self.model_name,
+            "base_url": self.base_url,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "top_p": self.top_p,
+            "http2": self.http2,
+            "async_transport": self.async_transport
+        })
+        
         super().__init__()
     
+    @property
+    def cache_hits(self) -> int:
+        """Количество ответов, взятых из семантического кэша"""
+        return self.semantic_cache.hits if self.semantic_cache is not None else 0
+    
+    @property
+    def cache_misses(self) -> int:
+        """Количество запросов, не найденных в семантическом кэше"""
+        return self.semantic_cache.misses if self.semantic_cache is not None else 0
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """
+        Асинхронный клиент Cloud.ru
+        
+        Транспорт выбирается параметром async_transport: aiohttp не упирается
+        в пул соединений httpx при большом числе параллельных HTTP/1.1
+        запросов, а httpx позволяет мультиплексировать их через HTTP/2
+        
+        Сессия клиента живет в event loop, где была создана, поэтому при
+        вызове из другого loop (например, повторный asyncio.run) клиент
+        пересоздается. Доступен только внутри запущенного event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is not None and self._async_loop is not loop:
+            # Старый loop уже закрыт или работает в другом потоке:
+            # закрыть его соединения отсюда нельзя, просто отпускаем клиент
+            self._async_client = None
+        
+        if self._async_client is None:
+            if self.async_transport == "aiohttp":
+                http_client = DefaultAioHttpClient(
+                    limits=self._limits,
+                    timeout=60.0
+                )
+            else:
+                http_client = DefaultAsyncHttpxClient(
+                    http2=self.http2,
+                    limits=self._limits,
+                    timeout=60.0
+                )
+            
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=60.0,
+                max_retries=2,
+                http_client=http_client
+            )
+            self._async_loop = loop
+        return self._async_client
+    
     def generate(
         self, 
         messages,
@@ -84,149 +358,308 @@ class CloudRuModel(Model):
         Returns:
             ChatMessage объект для совместимости с smolagents
         """
+        is_code_agent, valid_stops = _parse_stop_sequences(stop_sequences)
         try:
-            # Конвертируем сообщения для Cloud.ru API
-            converted_messages = []
+            request_params = self._prepare_request(messages, is_code_agent, valid_stops, **kwargs)
             
-            for msg in messages:
-                # Извлекаем роль и контент
-                if hasattr(msg, 'role'):
-                    role = str(msg.role).replace("MessageRole.", "").lower()
-                    
-                    # Обрабатываем контент
-                    if hasattr(msg, 'content'):
-                        content = msg.content
-                        # Если контент - это список с dict внутри
-                        if isinstance(content, list) and len(content) > 0:
-                            if isinstance(content[0], dict) and 'text' in content[0]:
-                                content = content[0]['text']
-                            else:
-                                content = str(content)
-                    else:
-                        content = str(msg)
-                else:
-                    # Если это уже dict
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                
-                # Конвертируем роли для совместимости с Cloud.ru
-                if role in ["tool_call", "tool-call"]:
-                    # Пропускаем tool_call сообщения
-                    continue
-                elif role in ["tool_response", "tool-response"]:
-                    # Конвертируем tool_response в assistant для контекста
-                    converted_messages.append({
-                        "role": "assistant",
-                        "content": content if isinstance(content, str) else str(content)
-                    })
-                elif role == "system":
-                    # Системные сообщения остаются как есть
-                    converted_messages.append({
-                        "role": "system",
-                        "content": content if isinstance(content, str) else str(content)
-                    })
-                elif role == "user":
-                    converted_messages.append({
-                        "role": "user",
-                        "content": content if isinstance(content, str) else str(content)
-                    })
-                elif role == "assistant":
-                    converted_messages.append({
-                        "role": "assistant",
-                        "content": content if isinstance(content, str) else str(content)
-                    })
+            cache_key, cached = self._cache_lookup(request_params)
+            if cached is not None:
+                return cached
             
-            # Если слишком длинное системное сообщение, упрощаем его
-            if converted_messages and converted_messages[0]["role"] == "system":
-                system_msg = converted_messages[0]["content"]
-                if len(system_msg) > 10000:  # Если очень длинное
-                    # Создаем упрощенное системное сообщение для GLM-4.5
-                    # GLM-4.5 поддерживает reasoning mode и tool calling
-                    converted_messages[0] = {
-                        "role": "system",
-                        "content": (
-                            "You are an expert assistant who solves tasks step by step using code.\n"
-                            "GLM-4.5 reasoning mode enabled.\n"
-                            "Always respond in this format:\n"
-                            "Thought: [your reasoning]\n"
-                            "<code>\n[your python code]\n</code>\n"
-                            "Use print() to output intermediate results.\n"
-                            "Use final_answer() to provide the final result."
-                        )
-                    }
+            # Выполняем запрос к Cloud.ru API
+            response = self.client.chat.completions.create(**request_params)
             
-            # Убеждаемся, что есть хотя бы одно сообщение
-            if not converted_messages:
-                converted_messages = [{"role": "user", "content": "Hello"}]
+            chat_message = self._build_response(response, is_code_agent)
+            self._cache_store(cache_key, chat_message)
+            return chat_message
             
-            # Добавляем подсказку для правильного формата ответа, если нужно
-            if stop_sequences and "<code>" in str(stop_sequences):
-                # Это CodeAgent запрос - добавляем подсказку о формате
-                if converted_messages[-1]["role"] == "user":
-                    converted_messages[-1]["content"] += (
-                        "\n\nRemember to respond with:\nThought: [reasoning]\n<code>\n[python code]\n</code>"
-                    )
+        except Exception as e:
+            return self._build_error_response(e, is_code_agent)
+    
+    async def agenerate(
+        self, 
+        messages,
+        stop_sequences=None,
+        response_format=None,
+        tools_to_call_from=None,
+        **kwargs
+    ):
+        """
+        Асинхронный вариант generate для параллельных запросов
+        
+        Принимает те же аргументы, что и generate. Несколько вызовов можно
+        выполнять одновременно через asyncio.gather
+        
+        Returns:
+            ChatMessage объект для совместимости с smolagents
+        """
+        is_code_agent, valid_stops = _parse_stop_sequences(stop_sequences)
+        try:
+            request_params = self._prepare_request(messages, is_code_agent, valid_stops, **kwargs)
             
-            # Параметры для запроса
-            request_params = {
-                "model": self.model_name,
-                "messages": converted_messages,
-                "temperature": kwargs.get("temperature", self.temperature),
-                "max_tokens": kwargs.get("max_tokens", self.max_tokens),
-                "top_p": kwargs.get("top_p", self.top_p),
-                "presence_penalty": kwargs.get("presence_penalty", self.presence_penalty)
-            }
+            # Эмбеддинг запроса и SQLite работают в отдельном потоке,
+            # чтобы не блокировать event loop для параллельных agenerate
+            cache_key, cached = None, None
+            if self.semantic_cache is not None:
+                cache_key, cached = await asyncio.to_thread(self._cache_lookup, request_params)
+                if cached is not None:
+                    return cached
             
-            # Добавляем stop sequences если есть
-            if stop_sequences:
-                # Cloud.ru может не поддерживать все stop sequences
-                valid_stops = [s for s in stop_sequences if isinstance(s, str) and len(s) > 0]
-                if valid_stops:
-                    request_params["stop"] = valid_stops[:4]  # Максимум 4 stop sequences
+            # Выполняем запрос к Cloud.ru API без блокировки event loop
+            response = await self.async_client.chat.completions.create(**request_params)
             
-            # Выполняем запрос к Cloud.ru API
-            response = self.client.chat.completions.create(**request_params)
+            chat_message = self._build_response(response, is_code_agent)
+            if cache_key is not None:
+                await asyncio.to_thread(self._cache_store, cache_key, chat_message)
+            return chat_message
             
-            # Получаем ответ
-            content = response.choices[0].message.content
+        except Exception as e:
+            return self._build_error_response(e, is_code_agent)
+    
+    def generate_stream(
+        self, 
+        messages,
+        stop_sequences=None,
+        response_format=None,
+        tools_to_call_from=None,
+        **kwargs
+    ) -> Iterator[ChatMessageStreamDelta]:
+        """
+        Потоковая генерация ответа (совместимость с smolagents)
+        
+        Принимает те же аргументы, что и generate, и отдает текст по мере
+        генерации. Для CodeAgent стрим закрывается сразу после </code>,
+        чтобы Cloud.ru не генерировал лишние токены
+        
+        Yields:
+            ChatMessageStreamDelta с очередным фрагментом ответа
+        """
+        is_code_agent, valid_stops = _parse_stop_sequences(stop_sequences)
+        try:
+            request_params = self._prepare_request(messages, is_code_agent, valid_stops, **kwargs)
             
-            # Проверяем, нужно ли добавить формат для CodeAgent
-            if stop_sequences and "<code>" in str(stop_sequences):
-                # Если ответ не содержит нужный формат, добавляем его
-                if "Thought:" not in content and "<code>" not in content:
-                    # Пытаемся обернуть ответ в нужный формат
-                    if "print" in content.lower() or "def " in content or "import " in content:
-                        # Похоже на код
-                        content = f"Thought: I will execute the requested code.\n<code>\n{content}\n</code>"
-                    else:
-                        # Обычный текст - превращаем в код с print
-                        content = f"Thought: I will print the answer.\n<code>\nprint('{content}')\n</code>"
+            # Выход из with закрывает соединение и прерывает генерацию на сервере
+            with self.client.chat.completions.create(stream=True, **request_params) as response:
+                tail = ""
+                for chunk in response:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    
+                    delta, done = chunk.choices[0].delta.content, False
+                    if is_code_agent:
+                        delta, done = _cut_after_code_end(tail, delta)
+                        tail = (tail + delta)[-(len(_CODE_END) - 1):]
+                    
+                    yield ChatMessageStreamDelta(content=delta)
+                    if done:
+                        break
             
-            # Создаем объект ChatMessage для совместимости с smolagents
-            from smolagents import ChatMessage
+        except Exception as e:
+            yield ChatMessageStreamDelta(content=self._build_error_response(e, is_code_agent).content)
+    
+    async def agenerate_stream(
+        self, 
+        messages,
+        stop_sequences=None,
+        response_format=None,
+        tools_to_call_from=None,
+        **kwargs
+    ) -> AsyncIterator[ChatMessageStreamDelta]:
+        """
+        Асинхронный вариант generate_stream
+        
+        Yields:
+            ChatMessageStreamDelta с очередным фрагментом ответа
+        """
+        is_code_agent, valid_stops = _parse_stop_sequences(stop_sequences)
+        try:
+            request_params = self._prepare_request(messages, is_code_agent, valid_stops, **kwargs)
             
-            return ChatMessage(
-                role="assistant",
-                content=content
-            )
+            response = await self.async_client.chat.completions.create(stream=True, **request_params)
+            async with response:
+                tail = ""
+                async for chunk in response:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    
+                    delta, done = chunk.choices[0].delta.content, False
+                    if is_code_agent:
+                        delta, done = _cut_after_code_end(tail, delta)
+                        tail = (tail + delta)[-(len(_CODE_END) - 1):]
+                    
+                    yield ChatMessageStreamDelta(content=delta)
+                    if done:
+                        break
             
         except Exception as e:
-            error_msg = f"Ошибка при запросе к Cloud.ru API: {str(e)}"
-            print(error_msg)
-            
-            # Для CodeAgent возвращаем ответ в правильном формате
-            if stop_sequences and "<code>" in str(stop_sequences):
-                from smolagents import ChatMessage
-                return ChatMessage(
-                    role="assistant",
-                    content=f"Thought: An error occurred.\n<code>\nprint('Error: {str(e)}')\n</code>"
-                )
-            else:
-                from smolagents import ChatMessage
-                return ChatMessage(
-                    role="assistant", 
-                    content=f"Извините, произошла ошибка: {str(e)}"
-                )
+            yield ChatMessageStreamDelta(content=self._build_error_response(e, is_code_agent).content)
+    
+    def _prepare_request(
+        self,
+        messages,
+        is_code_agent: bool = False,
+        valid_stops: Optional[List[str]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Конвертирует сообщения smolagents и собирает параметры запроса к Cloud.ru API
+        """
+        # Конвертируем сообщения для Cloud.ru API
+        converted_messages = _convert_messages(messages)
+        
+        # Подменяем системное сообщение заданным или упрощаем слишком длинное
+        if converted_messages and converted_messages[0]["role"] == "system":
+            if self._system_message is not None:
+                converted_messages[0] = self._system_message
+            elif len(converted_messages[0]["content"]) > MAX_SYSTEM_PROMPT_LENGTH:
+                converted_messages[0] = _SIMPLIFIED_SYSTEM_MESSAGE
+        
+        # Убеждаемся, что есть хотя бы одно сообщение
+        if not converted_messages:
+            converted_messages = [{"role": "user", "content": "Hello"}]
+        
+        # Добавляем подсказку для правильного формата ответа, если нужно
+        if is_code_agent:
+            # Это CodeAgent запрос - добавляем подсказку о формате
+            # Заменяем последнее сообщение новым dict, не изменяя входные сообщения
+            if converted_messages[-1]["role"] == "user":
+                converted_messages[-1] = {
+                    "role": "user",
+                    "content": converted_messages[-1]["content"] + (
+                        "\n\nRemember to respond with:\nThought: [reasoning]\n<code>\n[python code]\n</code>"
+                    )
+                }
+        
+        # Параметры для запроса
+        request_params = {
+            "model": self.model_name,
+            "messages": converted_messages,
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens),
+            "top_p": kwargs.get("top_p", self.top_p),
+            "presence_penalty": kwargs.get("presence_penalty", self.presence_penalty)
+        }
+        
+        # Добавляем stop sequences если есть
+        if valid_stops:
+            request_params["stop"] = valid_stops
+        
+        return request_params
+    
+    def _cache_lookup(self, request_params: Dict[str, Any]):
+        """
+        Ищет ответ в семантическом кэше
+        
+        Ключ кэша - последнее сообщение пользователя, а вся предшествующая
+        переписка и параметры запроса входят в namespace. Так шаги агента
+        с одинаковой задачей, но разной историей, не получают чужой ответ
+        
+        Ошибки кэша (занятая SQLite база, сбой энкодера) не прерывают запрос:
+        они логируются, и ответ запрашивается у Cloud.ru
+        
+        Returns:
+            Кортеж (ключ кэша или None, ChatMessage из кэша или None)
+        """
+        if self.semantic_cache is None:
+            return None, None
+        
+        messages = request_params["messages"]
+        if messages[-1]["role"] != "user":
+            return None, None
+        
+        context = dict(request_params, messages=messages[:-1])
+        namespace = hashlib.sha256(
+            json.dumps(context, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        cache_key = (namespace, messages[-1]["content"])
+        
+        try:
+            content = self.semantic_cache.lookup(*cache_key)
+        except Exception as e:
+            print(_CACHE_ERROR_LOG_TEMPLATE.format(e))
+            return None, None
+        if content is None:
+            return cache_key, None
+        
+        return cache_key, ChatMessage(role="assistant", content=content)
+    
+    def _cache_store(self, cache_key: Optional[Tuple[str, str]], chat_message):
+        """
+        Сохраняет успешный ответ модели в семантический кэш
+        
+        Ошибка записи только логируется: ответ уже получен и возвращается
+        """
+        if cache_key is None:
+            return
+        try:
+            self.semantic_cache.insert(*cache_key, chat_message.content)
+        except Exception as e:
+            print(_CACHE_ERROR_LOG_TEMPLATE.format(e))
+    
+    def _build_response(self, response, is_code_agent: bool = False):
+        """
+        Извлекает текст ответа Cloud.ru API и оборачивает его в ChatMessage
+        """
+        # Получаем ответ
+        content = response.choices[0].message.content
+        
+        # Проверяем, нужно ли добавить формат для CodeAgent
+        if is_code_agent:
+            # Если ответ не содержит нужный формат, добавляем его
+            if "Thought:" not in content and "<code>" not in content:
+                # Пытаемся обернуть ответ в нужный формат
+                if "print" in content.lower() or "def " in content or "import " in content:
+                    # Похоже на код
+                    content = f"Thought: I will execute the requested code.\n<code>\n{content}\n</code>"
+                else:
+                    # Обычный текст - превращаем в код с print
+                    content = f"Thought: I will print the answer.\n<code>\nprint('{content}')\n</code>"
+        
+        # Создаем объект ChatMessage для совместимости с smolagents
+        return ChatMessage(
+            role="assistant",
+            content=content
+        )
+    
+    def _build_error_response(self, e: Exception, is_code_agent: bool = False):
+        """
+        Формирует ChatMessage с описанием ошибки запроса к Cloud.ru API
+        """
+        error = str(e)
+        print(_ERROR_LOG_TEMPLATE.format(error))
+        
+        # Для CodeAgent возвращаем ответ в правильном формате
+        if is_code_agent:
+            content = _CODE_AGENT_ERROR_TEMPLATE.format(f"Error: {error}")
+        else:
+            content = _ERROR_TEMPLATE.format(error)
+        
+        return ChatMessage(role="assistant", content=content)
+    
+    def close(self):
+        """
+        Закрывает HTTP-соединения синхронного клиента и базу семантического кэша
+        
+        Асинхронный клиент закрывается через aclose внутри его event loop
+        """
+        self.client.close()
+        if self.semantic_cache is not None:
+            self.semantic_cache.close()
+    
+    async def aclose(self):
+        """
+        Закрывает асинхронный клиент, затем ресурсы синхронного (см. close)
+        
+        Вызывайте в том же event loop, где выполнялись agenerate, например
+        в конце корутины, переданной в asyncio.run
+        """
+        if self._async_client is not None:
+            # Клиент из другого event loop закрыть отсюда нельзя
+            if self._async_loop is asyncio.get_running_loop():
+                await self._async_client.close()
+            self._async_client = None
+            self._async_loop = None
+        self.close()
     
     def __call__(
         self, 
@@ -242,21 +675,14 @@ class CloudRuModel(Model):
         except Exception as e:
             return f"Ошибка: {str(e)}"
     
-    def get_model_info(self) -> Dict[str, Any]:
+    def get_model_info(self) -> Mapping[str, Any]:
         """
         Получить информацию о модели
         
         Returns:
-            Dict с информацией о модели
+            Неизменяемый словарь с информацией о модели
         """
-        return {
-            "provider": "Cloud.ru",
-            "model_name": self.model_name,
-            "base_url": self.base_url,
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens,
-            "top_p": self.top_p
-        }
+        return self._info
 
 
 def create_cloud_ru_model(**kwargs) -> CloudRuModel:
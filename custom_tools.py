@@ -1,11 +1,160 @@
 import os
+import re
+import time
+import sqlite3
+import asyncio
+import functools
+import threading
 import requests
 import json
+import orjson
 import xmltodict
-from typing import Any, Dict, List, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from smolagents.tools import Tool
 
 
+# Таймауты запросов к внешним API: (подключение, чтение) в секундах
+REQUEST_TIMEOUT = (5, 30)
+
+# Сколько запросов к внешним API выполняется одновременно при пакетных вызовах;
+# совпадает с размером пула соединений сессии
+MAX_CONCURRENT_REQUESTS = 16
+
+# Общая сессия для всех инструментов: соединения к Serper, ЦБ РФ и Geoapify
+# переиспользуются между вызовами, без нового TCP+TLS рукопожатия каждый раз.
+# Ответы 429/5xx повторяются с экспоненциальной задержкой (с учетом Retry-After),
+# в том числе POST к Serper: поисковый запрос можно безопасно повторить
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=MAX_CONCURRENT_REQUESTS,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True
+        )
+    )
+)
+
+# Курсы ЦБ РФ обновляются раз в сутки, поэтому ответ кэшируется на 10 минут
+CBR_URL = "https://www.cbr-xml-daily.ru/daily_json.js"
+CBR_CACHE_TTL = 600
+
+
+@functools.lru_cache(maxsize=1)
+def _fetch_cbr_usd_rate(ttl_bucket: int) -> Tuple[str, float]:
+    """
+    Загрузить дату и курс USD от ЦБ РФ
+
+    ttl_bucket меняется каждые CBR_CACHE_TTL секунд, сбрасывая кэш.
+    Ошибки не кэшируются: lru_cache не сохраняет выброшенные исключения
+    """
+    response = _SESSION.get(CBR_URL, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+
+    return data['Date'], data['Valute']['USD']['Value']
+
+
+# Агент часто повторяет один и тот же поиск между итерациями:
+# результаты Serper кэшируются на 30 минут, не более 512 запросов (LRU)
+SERPER_CACHE_TTL = 1800
+SERPER_CACHE_MAXSIZE = 512
+_SERPER_CACHE: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_SERPER_CACHE_LOCK = threading.Lock()
+
+
+def _normalize_query(query: str) -> str:
+    """Привести запрос к нижнему регистру и схлопнуть пробелы"""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+# Координаты адресов не меняются: результаты геокодирования кэшируются
+# в памяти (LRU, не более 4096 адресов) и на диске (SQLite), чтобы не платить
+# за повторные запросы. Ключ кэша - нормализованный адрес
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+GEOCODE_CACHE_MAXSIZE = 4096
+_GEOCODE_CACHE: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+_GEOCODE_DB = None
+_GEOCODE_CACHE_LOCK = threading.Lock()
+
+
+def _geocode_db() -> sqlite3.Connection:
+    """
+    Открыть дисковый кэш геокодирования при первом обращении
+
+    Соединение используется из разных потоков (batch_geocode, batch_forward),
+    поэтому открывается с check_same_thread=False; доступ к нему
+    сериализуется _GEOCODE_CACHE_LOCK
+    """
+    global _GEOCODE_DB
+    if _GEOCODE_DB is None:
+        _GEOCODE_DB = sqlite3.connect(GEOCODE_CACHE_PATH, check_same_thread=False)
+        _GEOCODE_DB.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "address TEXT PRIMARY KEY, lat REAL, lon REAL)"
+        )
+        _GEOCODE_DB.commit()
+    return _GEOCODE_DB
+
+
+def _geocode_cache_put(cache_key: str, coords: Tuple[float, float]):
+    """Сохранить координаты в LRU в памяти; вызывается под _GEOCODE_CACHE_LOCK"""
+    _GEOCODE_CACHE[cache_key] = coords
+    _GEOCODE_CACHE.move_to_end(cache_key)
+    if len(_GEOCODE_CACHE) > GEOCODE_CACHE_MAXSIZE:
+        _GEOCODE_CACHE.popitem(last=False)
+
+
+def _geocode(address: str, api_key: str) -> Tuple[float, float]:
+    """
+    Получить координаты адреса через Geoapify
+
+    В Geoapify отправляется исходный адрес, а кэши используют его
+    нормализованную форму. При ошибке выбрасывает исключение, поэтому
+    неудачные запросы не попадают ни в один из кэшей
+    """
+    cache_key = _normalize_query(address)
+
+    with _GEOCODE_CACHE_LOCK:
+        coords = _GEOCODE_CACHE.get(cache_key)
+        if coords is None:
+            coords = _geocode_db().execute(
+                "SELECT lat, lon FROM geocode WHERE address = ?", (cache_key,)
+            ).fetchone()
+        if coords is not None:
+            _geocode_cache_put(cache_key, coords)
+            return coords
+
+    response = _SESSION.get(
+        "https://api.geoapify.com/v1/geocode/search",
+        params={"text": address, "lang": "ru", "limit": 1, "apiKey": api_key},
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+
+    properties = orjson.loads(response.content)['features'][0]['properties']
+    coords = (properties['lat'], properties['lon'])
+
+    with _GEOCODE_CACHE_LOCK:
+        _geocode_cache_put(cache_key, coords)
+        db = _geocode_db()
+        db.execute(
+            "INSERT OR REPLACE INTO geocode (address, lat, lon) VALUES (?, ?, ?)",
+            (cache_key, coords[0], coords[1])
+        )
+        db.commit()
+    return coords
+
+
 class SerperSearchTool(Tool):
     """Инструмент для поиска банков через Serper.dev API"""
     name = "serper_search"
@@ -18,6 +167,16 @@ class SerperSearchTool(Tool):
         if not api_key:
             return "Error: SERPER_API_KEY not found in environment variables"
         
+        cache_key = _normalize_query(query)
+        with _SERPER_CACHE_LOCK:
+            cached = _SERPER_CACHE.get(cache_key)
+            if cached is not None:
+                expires_at, formatted = cached
+                if expires_at > time.monotonic():
+                    _SERPER_CACHE.move_to_end(cache_key)
+                    return formatted
+                del _SERPER_CACHE[cache_key]
+        
         url = "https://google.serper.dev/search"
         headers = {
             'X-API-KEY': api_key,
@@ -29,9 +188,9 @@ class SerperSearchTool(Tool):
         }
         
         try:
-            response = requests.post(url, json=data, headers=headers)
+            response = _SESSION.post(url, json=data, headers=headers, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
-            results = response.json()
+            results = orjson.loads(response.content)
             
             # Форматируем результаты
             formatted_results = []
@@ -41,13 +200,24 @@ class SerperSearchTool(Tool):
                                            f"Адрес: {result.get('snippet', 'N/A')}\n"
                                            f"Ссылка: {result.get('link', 'N/A')}\n")
             
-            return "\n".join(formatted_results) if formatted_results else "Банки не найдены"
+            formatted = "\n".join(formatted_results) if formatted_results else "Банки не найдены"
+            
+            with _SERPER_CACHE_LOCK:
+                _SERPER_CACHE[cache_key] = (time.monotonic() + SERPER_CACHE_TTL, formatted)
+                if len(_SERPER_CACHE) > SERPER_CACHE_MAXSIZE:
+                    _SERPER_CACHE.popitem(last=False)
+            
+            return formatted
         
         except requests.RequestException as e:
             return f"Error making request to Serper API: {str(e)}"
-        except Exception as e:
+        except (KeyError, IndexError, TypeError, ValueError) as e:
             return f"Error processing Serper API response: {str(e)}"
 
+    async def aforward(self, query: str) -> str:
+        """Асинхронный вариант forward для параллельных поисков через asyncio.gather"""
+        return await asyncio.to_thread(self.forward, query)
+
 
 class CBRCurrencyTool(Tool):
     """Инструмент для получения официального курса валют от ЦБ РФ"""
@@ -57,24 +227,21 @@ class CBRCurrencyTool(Tool):
     output_type = "string"
 
     def forward(self) -> str:
-        url = "https://www.cbr-xml-daily.ru/daily_json.js"
-        
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
             # Получаем курс USD
-            usd_rate = data['Valute']['USD']['Value']
-            date = data['Date']
+            date, usd_rate = _fetch_cbr_usd_rate(int(time.monotonic() // CBR_CACHE_TTL))
             
             return f"Официальный курс ЦБ РФ на {date[:10]}:\nUSD/RUB: {usd_rate:.4f} руб."
         
         except requests.RequestException as e:
             return f"Error fetching CBR data: {str(e)}"
-        except Exception as e:
+        except (KeyError, IndexError, TypeError, ValueError) as e:
             return f"Error processing CBR data: {str(e)}"
 
+    async def aforward(self) -> str:
+        """Асинхронный вариант forward"""
+        return await asyncio.to_thread(self.forward)
+
 
 class UserInputTool(Tool):
     """Инструмент для получения ввода от пользователя"""
@@ -100,19 +267,58 @@ class AddressToCoordsTool(Tool):
     output_type = "string"
 
     def forward(self, address: str) -> str:
-        lat, lon = 0.0, 0.0
-        api_key = os.environ["GEOAPIFY_API_KEY"]
-        try:
-            response = requests.get(
-                "https://api.geoapify.com/v1/geocode/search",
-                params={"text": address, "lang": "ru", "limit": 1, "apiKey": api_key},
-                timeout=30,
-            )
-            response.raise_for_status()
+        api_key = os.getenv("GEOAPIFY_API_KEY")
+        if not api_key:
+            return "Error: GEOAPIFY_API_KEY not found in environment variables"
 
-            lat = response.json()['features'][0]['properties']['lat']
-            lon = response.json()['features'][0]['properties']['lon']
-        except:
-            print("No coordinates")
+        try:
+            lat, lon = _geocode(address, api_key)
+        except requests.RequestException as e:
+            return f"Error making request to Geoapify API: {str(e)}"
+        except (KeyError, IndexError, ValueError) as e:
+            return f"No coordinates found for address '{address}': {str(e)}"
 
         return str((lat, lon))
+
+    async def aforward(self, address: str) -> str:
+        """Асинхронный вариант forward, см. также batch_geocode"""
+        return await asyncio.to_thread(self.forward, address)
+
+
+def batch_forward(tool: Tool, inputs: Iterable[Any]) -> List[str]:
+    """
+    Выполнить tool.forward для нескольких входов параллельно в пуле потоков
+
+    Для синхронного кода: K независимых запросов занимают время самого
+    медленного из них, а не сумму
+
+    Args:
+        tool: Инструмент с forward от одного аргумента
+        inputs: Аргументы для forward
+
+    Returns:
+        Результаты forward в порядке входов
+    """
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        return list(executor.map(tool.forward, inputs))
+
+
+async def batch_geocode(addresses: List[str]) -> List[str]:
+    """
+    Геокодировать несколько адресов параллельно
+
+    Не более MAX_CONCURRENT_REQUESTS запросов одновременно, чтобы
+    не упираться в лимиты Geoapify
+
+    Returns:
+        Координаты в формате AddressToCoordsTool.forward в порядке адресов
+    """
+    tool = AddressToCoordsTool()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def geocode(address: str) -> str:
+        async with semaphore:
+            return await tool.aforward(address)
+
+    return await asyncio.gather(*(geocode(address) for address in addresses))
+
@@ -0,0 +1,280 @@
+"""
+Семантический кэш ответов языковой модели
+Возвращает сохраненный ответ, если новый запрос близок по смыслу к уже заданному
+"""
+
+import sqlite3
+import functools
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+
+
+# Начиная с этого размера кэша поиск выполняется индексом FAISS,
+# для меньших кэшей достаточно одного матричного умножения NumPy
+FAISS_MIN_SIZE = 10_000
+
+
+class SemanticCache:
+    """
+    Кэш ответов модели с поиском по косинусной близости эмбеддингов
+
+    Эмбеддинги считаются локальной моделью sentence-transformers, поиск
+    ближайшего запроса - умножением эмбеддингов записей того же namespace
+    на вектор запроса (или индексом FAISS для кэшей больше FAISS_MIN_SIZE).
+    Записи вытесняются по LRU и сохраняются в SQLite, чтобы кэш переживал
+    перезапуск ноутбука
+
+    Методы можно вызывать из разных потоков (например, через asyncio.to_thread):
+    эмбеддинг считается вне блокировки, а состояние кэша и SQLite защищены ею
+    """
+
+    def __init__(
+        self,
+        embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.87,
+        max_size: int = 1000,
+        db_path: Optional[str] = "semantic_cache.db",
+        embedding_cache_size: int = 2048
+    ):
+        """
+        Инициализация семантического кэша
+
+        Args:
+            embedding_model: Название модели sentence-transformers для эмбеддингов
+            threshold: Минимальная косинусная близость для попадания в кэш
+            max_size: Максимальное количество записей в кэше
+            db_path: Путь к SQLite базе для сохранения кэша (None - только в памяти)
+            embedding_cache_size: Количество эмбеддингов, запоминаемых в памяти
+        """
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "Для семантического кэша установите зависимости: "
+                "pip install sentence-transformers"
+            ) from e
+
+        self.threshold = threshold
+        self.max_size = max_size
+
+        # Защищает записи, индекс, SQLite и счетчики при вызовах из разных потоков
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.encoder = SentenceTransformer(embedding_model)
+        self.dim = self.encoder.get_sentence_embedding_dimension()
+
+        # Повторные запросы агента (ретраи, перепланирование) не пересчитывают
+        # эмбеддинг; статистика доступна через embed_query.cache_info()
+        self.embed_query = functools.lru_cache(maxsize=embedding_cache_size)(self._embed)
+
+        # Скалярное произведение нормированных векторов = косинусная близость
+        self.index = None
+        if max_size > FAISS_MIN_SIZE:
+            try:
+                import faiss
+            except ImportError as e:
+                raise ImportError(
+                    f"Для кэша больше {FAISS_MIN_SIZE} записей установите faiss-cpu"
+                ) from e
+            self._faiss = faiss
+            self.index = faiss.IndexIDMap(faiss.IndexFlatIP(self.dim))
+        else:
+            # Строка i матрицы - эмбеддинг записи self._row_ids[i]; место
+            # выделено заранее (+1 под запись, добавляемую перед вытеснением)
+            self._matrix = np.zeros((max_size + 1, self.dim), dtype=np.float32)
+            self._row_ids = np.zeros(max_size + 1, dtype=np.int64)
+            self._rows: Dict[int, int] = {}
+
+        # id записи -> (namespace, ответ модели); порядок ключей задает LRU
+        self._entries: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()
+        # namespace -> id его записей: поиск идет только внутри namespace
+        self._namespaces: Dict[str, Set[int]] = {}
+        self._next_id = 0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY, namespace TEXT, prompt TEXT, "
+                "embedding BLOB, content TEXT)"
+            )
+            self.db.commit()
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _embed(self, text: str) -> np.ndarray:
+        """
+        Получить нормированный эмбеддинг текста
+
+        Returns:
+            Вектор float32 размерности self.dim. Результат кэшируется
+            и разделяется между вызовами, изменять его нельзя
+        """
+        return self.encoder.encode(
+            [text],
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )[0].astype(np.float32)
+
+    def lookup(self, namespace: str, prompt: str) -> Optional[str]:
+        """
+        Найти сохраненный ответ на близкий по смыслу запрос
+
+        Args:
+            namespace: Ключ контекста (системный промпт, параметры запроса);
+                ответ возвращается только для записей с тем же ключом
+            prompt: Текст запроса пользователя
+
+        Returns:
+            Сохраненный ответ модели или None, если подходящей записи нет
+        """
+        with self._lock:
+            if namespace not in self._namespaces:
+                self.misses += 1
+                return None
+
+        query = self.embed_query(prompt)
+
+        with self._lock:
+            best = self._search(query, namespace)
+            if best is None or best[0] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = best[1]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id][1]
+
+    def insert(self, namespace: str, prompt: str, content: str):
+        """
+        Сохранить ответ модели на запрос
+
+        Args:
+            namespace: Ключ контекста запроса
+            prompt: Текст запроса пользователя
+            content: Ответ модели
+        """
+        embedding = self.embed_query(prompt)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._add(entry_id, namespace, embedding, content)
+
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT INTO entries (id, namespace, prompt, embedding, content) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (entry_id, namespace, prompt, embedding.tobytes(), content)
+                )
+                self.db.commit()
+
+            self._evict()
+
+    def close(self):
+        """Закрыть соединение с SQLite базой"""
+        with self._lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def _search(self, query: np.ndarray, namespace: str) -> Optional[Tuple[float, int]]:
+        """Найти ближайшую запись в namespace: пара (близость, id) или None"""
+        ids = self._namespaces.get(namespace)
+        if not ids:
+            return None
+
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+        if self.index is not None:
+            params = self._faiss.SearchParameters(sel=self._faiss.IDSelectorBatch(ids))
+            scores, found = self.index.search(query[None, :], 1, params=params)
+            if found[0][0] < 0:
+                return None
+            return float(scores[0][0]), int(found[0][0])
+
+        rows = np.fromiter((self._rows[i] for i in ids), dtype=np.int64, count=len(ids))
+        sims = self._matrix[rows] @ query
+        best = int(np.argmax(sims))
+        return float(sims[best]), int(ids[best])
+
+    def _add(self, entry_id: int, namespace: str, embedding: np.ndarray, content: str):
+        if self.index is not None:
+            self.index.add_with_ids(embedding[None, :], np.array([entry_id], dtype=np.int64))
+        else:
+            row = len(self._rows)
+            self._matrix[row] = embedding
+            self._row_ids[row] = entry_id
+            self._rows[entry_id] = row
+        self._entries[entry_id] = (namespace, content)
+        self._namespaces.setdefault(namespace, set()).add(entry_id)
+
+    def _remove(self, entry_ids: List[int]):
+        if self.index is not None:
+            self.index.remove_ids(np.array(entry_ids, dtype=np.int64))
+            return
+
+        # Переносим последнюю строку на место удаленной, матрица остается плотной
+        for entry_id in entry_ids:
+            row = self._rows.pop(entry_id)
+            last = len(self._rows)
+            if row != last:
+                moved_id = int(self._row_ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._row_ids[row] = moved_id
+                self._rows[moved_id] = row
+
+    def _evict(self):
+        """Удалить самые давно использованные записи сверх max_size"""
+        evicted = []
+        while len(self._entries) > self.max_size:
+            entry_id, (namespace, _) = self._entries.popitem(last=False)
+            evicted.append(entry_id)
+
+            ids = self._namespaces[namespace]
+            ids.discard(entry_id)
+            if not ids:
+                del self._namespaces[namespace]
+
+        if not evicted:
+            return
+
+        self._remove(evicted)
+        if self.db is not None:
+            self.db.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in evicted])
+            self.db.commit()
+
+    def _load(self):
+        """Загрузить последние max_size записей из SQLite"""
+        rows = self.db.execute(
+            "SELECT id, namespace, embedding, content FROM entries "
+            "ORDER BY id DESC LIMIT ?",
+            (self.max_size,)
+        ).fetchall()
+
+        for entry_id, namespace, blob, content in reversed(rows):
+            embedding = np.frombuffer(blob, dtype=np.float32)
+            if embedding.shape[0] != self.dim:
+                # Запись от другой модели эмбеддингов
+                continue
+            self._add(entry_id, namespace, embedding, content)
+
+        max_id = self.db.execute("SELECT MAX(id) FROM entries").fetchone()[0]
+        self._next_id = (max_id or 0) + 1
+
+        # Удаляем из базы записи, не попавшие в кэш
+        self.db.execute(
+            "DELETE FROM entries WHERE id NOT IN "
+            "(SELECT id FROM entries ORDER BY id DESC LIMIT ?)",
+            (self.max_size,)
+        )
+        self.db.commit()